@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+from functools import wraps
+from typing import Any, Callable, Optional, Tuple
+import orjson
+import redis
+from cachetools import LRUCache
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL")
+
+_redis_client: Optional[redis.Redis] = None
+
+# In-process fallback used when Redis is not configured: key -> (expires_at, payload).
+# Values are stored serialized, like in Redis, so every read returns a fresh
+# copy that callers can mutate without corrupting the cache.
+_local_cache: "LRUCache[str, Tuple[float, bytes]]" = LRUCache(maxsize=4096)
+_local_lock = threading.Lock()
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """Get the shared Redis client, or None when REDIS_URL is not configured"""
+    global _redis_client
+    if _redis_client is None and REDIS_URL:
+        _redis_client = redis.Redis.from_url(REDIS_URL)
+    return _redis_client
+
+
+def get_json(key: str) -> Optional[Any]:
+    """Get a cached JSON value, or None on a miss"""
+    client = get_redis()
+    if client is not None:
+        payload = client.get(key)
+        return orjson.loads(payload) if payload is not None else None
+
+    with _local_lock:
+        entry = _local_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _local_cache[key]
+            return None
+        payload = entry[1]
+    return orjson.loads(payload)
+
+
+def set_json(key: str, value: Any, ttl: int) -> None:
+    """Cache a JSON-serializable value for ttl seconds"""
+    payload = orjson.dumps(value)
+    client = get_redis()
+    if client is not None:
+        client.setex(key, ttl, payload)
+        return
+
+    with _local_lock:
+        _local_cache[key] = (time.monotonic() + ttl, payload)
+
+
+async def get_json_async(key: str) -> Optional[Any]:
+    """get_json for coroutines; a Redis round-trip runs in the threadpool"""
+    if get_redis() is None:
+        return get_json(key)
+    return await run_in_threadpool(get_json, key)
+
+
+async def set_json_async(key: str, value: Any, ttl: int) -> None:
+    """set_json for coroutines; a Redis round-trip runs in the threadpool"""
+    if get_redis() is None:
+        set_json(key, value, ttl)
+    else:
+        await run_in_threadpool(set_json, key, value, ttl)
+
+
+def delete(*keys: str) -> None:
+    """Remove cached values"""
+    client = get_redis()
+    if client is not None:
+        if keys:
+            client.delete(*keys)
+        return
+
+    with _local_lock:
+        for key in keys:
+            _local_cache.pop(key, None)
+
+
+def delete_prefix(prefix: str) -> None:
+    """Remove every cached value whose key starts with prefix"""
+    client = get_redis()
+    if client is not None:
+        keys = list(client.scan_iter(match=f"{prefix}*"))
+        if keys:
+            client.delete(*keys)
+        return
+
+    with _local_lock:
+        for key in [k for k in _local_cache if k.startswith(prefix)]:
+            del _local_cache[key]
+
+
+def cached(key: str, ttl: int) -> Callable:
+    """Cache a function's JSON-serializable result under key.format(*args) for ttl seconds"""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args):
+            cache_key = key.format(*args)
+            value = get_json(cache_key)
+            if value is None:
+                value = func(*args)
+                if value is not None:
+                    set_json(cache_key, value, ttl)
+            return value
+        return wrapper
+    return decorator
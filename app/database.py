@@ -1,17 +1,61 @@
 import json
+import logging
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, func, inspect, select
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
 from .models import Base, Doctor, Booking
 from dotenv import load_dotenv
 
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./hospital.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_MEMORY = IS_SQLITE and (":memory:" in DATABASE_URL or DATABASE_URL.rstrip("/") == "sqlite:")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
 
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if IS_MEMORY:
+    # An in-memory database only exists on the connection that created it,
+    # so every session has to share that single connection.
+    engine = create_engine(
+        DATABASE_URL,
+        poolclass=StaticPool,
+        connect_args={"check_same_thread": False}
+    )
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        poolclass=QueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        connect_args={"check_same_thread": False} if IS_SQLITE else {}
+    )
+
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Tune every new SQLite connection: WAL journal, relaxed fsync and a 64MB page cache"""
+        cursor = dbapi_connection.cursor()
+        cursor.executescript(
+            "PRAGMA journal_mode=WAL;"
+            "PRAGMA synchronous=NORMAL;"
+            "PRAGMA temp_store=MEMORY;"
+            "PRAGMA cache_size=-64000;"
+            "PRAGMA mmap_size=268435456;"
+        )
+        cursor.close()
+
+
+# expire_on_commit=False keeps objects returned by the tools readable after
+# their session has been closed
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 
 def get_db():
@@ -23,12 +67,76 @@ def get_db():
         db.close()
 
 
+# Cleared by init_db() when duplicate bookings keep it from building the
+# unique uq_booking_slot index; see has_slot_index()
+_slot_index_ready = True
+
+
+def has_slot_index() -> bool:
+    """Whether uq_booking_slot exists, so inserts can rely on ON CONFLICT"""
+    return _slot_index_ready
+
+
+def _duplicate_bookings(conn):
+    """Find bookings that share a doctor/date/slot with an earlier booking
+
+    Databases created before uq_booking_slot existed may hold such rows;
+    they block building the index and are left for an operator to resolve.
+    """
+    first = select(func.min(Booking.id)).group_by(Booking.doctor_name, Booking.date, Booking.time_slot)
+    return conn.execute(
+        select(Booking.id, Booking.patient_name, Booking.doctor_name, Booking.date, Booking.time_slot)
+        .where(Booking.id.not_in(first))
+    ).all()
+
+
 def init_db(seed_path: str = "demo_db.json"):
     """Initialize database with seed data"""
+    if engine.dialect.name == "postgresql":
+        # Only needed for the optional trigram indexes, which are skipped
+        # when the role isn't allowed to create extensions
+        try:
+            with engine.begin() as conn:
+                conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except DBAPIError as e:
+            logger.warning("Could not create the pg_trgm extension, skipping trigram indexes: %s", e.orig)
     Base.metadata.create_all(bind=engine)
+    # create_all() skips tables that already exist, so add any indexes
+    # introduced after the database was first created. SQLite reflection
+    # doesn't report expression indexes, so look those up in its catalog.
+    with engine.begin() as conn:
+        if IS_SQLITE:
+            existing = set(conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'").scalars())
+        else:
+            inspector = inspect(conn)
+            existing = {
+                index["name"]
+                for table in Base.metadata.sorted_tables
+                for index in inspector.get_indexes(table.name)
+            }
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                if index.name == "uq_booking_slot":
+                    duplicates = _duplicate_bookings(conn)
+                    if duplicates:
+                        global _slot_index_ready
+                        _slot_index_ready = False
+                        logger.error(
+                            "Not creating uq_booking_slot: these bookings duplicate an earlier booking "
+                            "for the same doctor/date/slot and must be cancelled or moved first:\n%s",
+                            "\n".join(
+                                f"  id={row.id} patient={row.patient_name!r} doctor={row.doctor_name!r} "
+                                f"date={row.date} time={row.time_slot}"
+                                for row in duplicates
+                            )
+                        )
+                        continue
+                index.create(bind=conn)
     # load seed if DB empty
     db = SessionLocal()
-    dcount = db.query(Doctor).count()
+    dcount = db.scalar(select(func.count()).select_from(Doctor))
     if dcount == 0:
         with open(seed_path, "r", encoding="utf-8") as f:
             data = json.load(f)
@@ -1,7 +1,15 @@
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from redis.exceptions import LockError
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime
 from typing import List
+import asyncio
+import weakref
+import orjson
 import uvicorn
 
 from .database import get_db, init_db
@@ -12,16 +20,19 @@ from .schemas import (
 )
 from .tools import (
     list_departments, find_doctors_by_department, 
-    get_doctor_available_slots, create_booking,
-    get_all_doctors, get_patient_bookings
+    get_doctor_available_slots, get_doctor_weekly_availability, create_booking,
+    get_all_doctors, get_patient_bookings, invalidate_doctor_cache,
+    invalidate_availability_cache
 )
+from .cache import get_redis
 from .simple_agent import process_message
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Hospital Appointment Booking System",
     description="AI-powered appointment booking system with conversational interface",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -45,12 +56,45 @@ async def root():
     return {"message": "Hospital Appointment Booking System API", "status": "running"}
 
 
+# Per-session locks so turns of one conversation run one at a time while
+# different sessions proceed concurrently; unused locks are garbage collected.
+# With Redis, a Redis lock also serializes turns handled by other workers.
+_SESSION_LOCKS: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+# Upper bound on one turn (LLM round-trip included) before the Redis lock expires
+SESSION_LOCK_TIMEOUT = 60
+
+
+async def _run_turn(message: ChatMessage) -> dict:
+    """Process one chat turn, waiting for any in-flight turn of the same session"""
+    lock = _SESSION_LOCKS.setdefault(message.session_id, asyncio.Lock())
+    async with lock:
+        client = get_redis()
+        if client is None:
+            return await process_message(message.session_id, message.message)
+        
+        redis_lock = client.lock(
+            f"lock:sess:{message.session_id}",
+            timeout=SESSION_LOCK_TIMEOUT,
+            blocking_timeout=SESSION_LOCK_TIMEOUT
+        )
+        if not await run_in_threadpool(redis_lock.acquire):
+            raise RuntimeError("Timed out waiting for another turn of this session")
+        try:
+            return await process_message(message.session_id, message.message)
+        finally:
+            try:
+                await run_in_threadpool(redis_lock.release)
+            except LockError:
+                # The turn outlived the lock timeout; the lock is already gone
+                pass
+
+
 # Chat endpoint
 @app.post("/chat", response_model=ChatResponse)
 async def chat(message: ChatMessage):
     """Process chat messages with the AI agent"""
     try:
-        result = process_message(message.session_id, message.message)
+        result = await _run_turn(message)
         return ChatResponse(
             reply=result["reply"],
             done=result["done"],
@@ -60,22 +104,39 @@ async def chat(message: ChatMessage):
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
 
+def _ndjson_reply(result: dict):
+    """Yield the reply a line at a time, then the done/booking_details metadata"""
+    for line in result["reply"].splitlines(keepends=True):
+        yield orjson.dumps({"delta": line}) + b"\n"
+    yield orjson.dumps({"done": result["done"], "booking_details": result["booking_details"]}) + b"\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(message: ChatMessage):
+    """Process chat messages with the AI agent, streaming the reply as NDJSON"""
+    try:
+        result = await _run_turn(message)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
+    return StreamingResponse(_ndjson_reply(result), media_type="application/x-ndjson")
+
+
 # Doctor endpoints
 @app.get("/doctors", response_model=List[DoctorOut])
-async def get_doctors(db: Session = Depends(get_db)):
+def get_doctors(db: Session = Depends(get_db)):
     """Get all doctors"""
     doctors = get_all_doctors()
     return doctors
 
 
 @app.get("/doctors/departments", response_model=List[str])
-async def get_departments():
+def get_departments():
     """Get all available departments"""
     return list_departments()
 
 
 @app.get("/doctors/department/{department}", response_model=List[DoctorOut])
-async def get_doctors_by_department(department: str):
+def get_doctors_by_department(department: str):
     """Get doctors by department"""
     doctors = find_doctors_by_department(department)
     if not doctors:
@@ -83,9 +144,18 @@ async def get_doctors_by_department(department: str):
     return doctors
 
 
+def _validate_date(value: str) -> None:
+    """Reject dates that aren't YYYY-MM-DD as a client error rather than a 500"""
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
 @app.get("/doctors/{doctor_name}/availability/{date}")
-async def get_doctor_availability(doctor_name: str, date: str):
+def get_doctor_availability(doctor_name: str, date: str):
     """Get available time slots for a doctor on a specific date"""
+    _validate_date(date)
     try:
         slots = get_doctor_available_slots(doctor_name, date)
         return {
@@ -97,9 +167,23 @@ async def get_doctor_availability(doctor_name: str, date: str):
         raise HTTPException(status_code=500, detail=f"Error getting availability: {str(e)}")
 
 
+@app.get("/doctors/{doctor_name}/availability/week/{start_date}")
+def get_doctor_week_availability(doctor_name: str, start_date: str):
+    """Get available time slots for a doctor for the 7 days starting on a date"""
+    _validate_date(start_date)
+    try:
+        return {
+            "doctor_name": doctor_name,
+            "start_date": start_date,
+            "available_slots": get_doctor_weekly_availability(doctor_name, start_date)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting availability: {str(e)}")
+
+
 # Booking endpoints
 @app.post("/bookings", response_model=BookingOut)
-async def create_new_booking(booking: BookingIn):
+def create_new_booking(booking: BookingIn):
     """Create a new booking"""
     try:
         new_booking = create_booking(
@@ -111,27 +195,29 @@ async def create_new_booking(booking: BookingIn):
         if not new_booking:
             raise HTTPException(status_code=400, detail="Time slot is not available")
         return new_booking
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating booking: {str(e)}")
 
 
 @app.get("/bookings/patient/{patient_name}", response_model=List[BookingOut])
-async def get_patient_booking_history(patient_name: str):
+def get_patient_booking_history(patient_name: str):
     """Get booking history for a patient"""
     bookings = get_patient_bookings(patient_name)
     return bookings
 
 
 @app.get("/bookings", response_model=List[BookingOut])
-async def get_all_bookings(db: Session = Depends(get_db)):
+def get_all_bookings(db: Session = Depends(get_db)):
     """Get all bookings (admin endpoint)"""
-    bookings = db.query(Booking).all()
+    bookings = db.scalars(select(Booking)).all()
     return bookings
 
 
 # Admin endpoints
 @app.post("/doctors", response_model=DoctorOut)
-async def add_doctor(doctor: DoctorIn, db: Session = Depends(get_db)):
+def add_doctor(doctor: DoctorIn, db: Session = Depends(get_db)):
     """Add a new doctor (admin endpoint)"""
     db_doctor = Doctor(
         doctor_name=doctor.doctor_name,
@@ -142,31 +228,34 @@ async def add_doctor(doctor: DoctorIn, db: Session = Depends(get_db)):
     )
     db.add(db_doctor)
     db.commit()
+    invalidate_doctor_cache()
     db.refresh(db_doctor)
     return db_doctor
 
 
 @app.delete("/doctors/{doctor_id}")
-async def delete_doctor(doctor_id: int, db: Session = Depends(get_db)):
+def delete_doctor(doctor_id: int, db: Session = Depends(get_db)):
     """Delete a doctor (admin endpoint)"""
-    doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
+    doctor = db.get(Doctor, doctor_id)
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
     
     db.delete(doctor)
     db.commit()
+    invalidate_doctor_cache()
     return {"message": "Doctor deleted successfully"}
 
 
 @app.delete("/bookings/{booking_id}")
-async def cancel_booking(booking_id: int, db: Session = Depends(get_db)):
+def cancel_booking(booking_id: int, db: Session = Depends(get_db)):
     """Cancel a booking"""
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
+    booking = db.get(Booking, booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
     db.delete(booking)
     db.commit()
+    invalidate_availability_cache(booking.doctor_name, booking.date)
     return {"message": "Booking cancelled successfully"}
 
 
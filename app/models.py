@@ -1,12 +1,33 @@
-from sqlalchemy import Column, Integer, String, Date, Time
+from sqlalchemy import Column, Integer, String, Date, Time, Index, func
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import validates
 
 
 Base = declarative_base()
 
 
+def _pg_trgm_installed(ddl, target, bind, **kw):
+    """Only build trigram indexes once init_db() managed to install pg_trgm"""
+    if bind is None:
+        return True
+    return bool(bind.exec_driver_sql("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'").scalar())
+
+
 class Doctor(Base):
     __tablename__ = "doctors"
+    __table_args__ = (
+        # Trigram indexes let PostgreSQL serve the ILIKE '%...%' lookups in
+        # find_doctors_by_department/find_doctor_by_name; other databases, and
+        # PostgreSQL without the pg_trgm extension, skip them
+        Index(
+            "ix_doctor_department_trgm", "department",
+            postgresql_using="gin", postgresql_ops={"department": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql", callable_=_pg_trgm_installed),
+        Index(
+            "ix_doctor_name_trgm", "doctor_name",
+            postgresql_using="gin", postgresql_ops={"doctor_name": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql", callable_=_pg_trgm_installed),
+    )
     id = Column(Integer, primary_key=True, index=True)
     doctor_name = Column(String, index=True)
     department = Column(String, index=True)
@@ -14,9 +35,25 @@ class Doctor(Base):
     available_end = Column(String)    # e.g., "17:00"
     off_day = Column(String, nullable=True)  # e.g., "Friday"
 
+    @validates("off_day")
+    def _normalize_off_day(self, key, value):
+        # Store weekday names as "Friday" so availability checks can compare directly
+        return value.strip().title() if value and value.strip() else None
+
+
+# Expression indexes for the case-insensitive exact matches tried before the
+# ILIKE fallback in find_doctors_by_department/find_doctor_by_name
+Index("ix_doctor_dept_lower", func.lower(Doctor.department))
+Index("ix_doctor_name_lower", func.lower(Doctor.doctor_name))
+
 
 class Booking(Base):
     __tablename__ = "bookings"
+    __table_args__ = (
+        # One booking per doctor/date/slot; the (doctor_name, date) prefix also
+        # serves the availability lookups
+        Index("uq_booking_slot", "doctor_name", "date", "time_slot", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     patient_name = Column(String, index=True)
     doctor_name = Column(String, index=True)
@@ -1,14 +1,23 @@
 import os
+import re
 import json
+import time
+import hashlib
+from dataclasses import dataclass, asdict, fields
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import orjson
+from cachetools import TTLCache
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
+from starlette.concurrency import run_in_threadpool
 from .tools import (
-    list_departments, find_doctors_by_department, find_doctor_by_name,
-    get_doctor_available_slots, create_booking, suggest_alternative_slots,
-    check_doctor_availability
+    department_list_text, doctor_list_text, find_doctor_by_name,
+    get_doctor_available_slots, get_availability, get_doctor_weekly_availability,
+    create_booking, suggest_alternative_slots
 )
+from .cache import get_redis, get_json_async, set_json_async
 
 
 # Load environment variables
@@ -19,103 +28,295 @@ load_dotenv()
 llm = ChatOpenAI(
     model="gpt-3.5-turbo",
     temperature=0.1,
-    api_key=os.getenv("OPENAI_API_KEY")
+    api_key=os.getenv("OPENAI_API_KEY"),
+    model_kwargs={"response_format": {"type": "json_object"}}
 )
 
+# Static part of the intent extraction prompt; only the user message is appended per call
+_INTENT_PROMPT_PREFIX = """
+Analyze this message and extract:
+1. Intent: "greeting", "book_appointment", "provide_name", "select_department", "select_doctor", "select_time", "confirm_booking", "other"
+2. Patient name (if mentioned)
+3. Department (if mentioned) - look for: Cardiology, Dermatology, Emergency Medicine, Family Medicine, Gastroenterology, Nephrology, Neurology, Oncology, Ophthalmology, Orthopedics, Pathology, Pediatrics, Radiology, Surgery
+4. Doctor name (if mentioned)
+5. Date (if mentioned, format as YYYY-MM-DD)
+6. Time (if mentioned, format as HH:MM)
+7. Problem description (if mentioned)
 
+Important: If the user mentions a department name (like "pathology", "surgery", "neurology"), set the department field to the full department name.
+
+Return JSON format:
+{
+    "intent": "...",
+    "patient_name": "...",
+    "department": "...",
+    "doctor_name": "...",
+    "date": "...",
+    "time": "...",
+    "problem_description": "..."
+}
+
+Message: """
+
+
+@dataclass(slots=True)
 class ConversationState:
-    def __init__(self):
-        self.patient_name = None
-        self.intent = None
-        self.selected_department = None
-        self.selected_doctor = None
-        self.selected_date = None
-        self.selected_time = None
-        self.booking_confirmed = False
-        self.booking_details = None
-        self.step = "welcome"  # Track current step
+    patient_name: Optional[str] = None
+    intent: Optional[str] = None
+    selected_department: Optional[str] = None
+    selected_doctor: Optional[str] = None
+    selected_date: Optional[str] = None
+    selected_time: Optional[str] = None
+    booking_confirmed: bool = False
+    booking_details: Optional[dict] = None
+    step: str = "welcome"  # Track current step
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ConversationState":
+        return cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+
+
+# Department keyword -> canonical department name
+DEPARTMENT_MAP = {
+    "cardiology": "Cardiology",
+    "dermatology": "Dermatology",
+    "emergency medicine": "Emergency Medicine",
+    "family medicine": "Family Medicine",
+    "gastroenterology": "Gastroenterology",
+    "nephrology": "Nephrology",
+    "neurology": "Neurology",
+    "oncology": "Oncology",
+    "ophthalmology": "Ophthalmology",
+    "orthopedics": "Orthopedics",
+    "pathology": "Pathology",
+    "pediatrics": "Pediatrics",
+    "radiology": "Radiology",
+    "surgery": "Surgery"
+}
+DEPT_RE = re.compile("|".join(re.escape(k) for k in DEPARTMENT_MAP), re.IGNORECASE)
+
+# Symptom keywords used to suggest a department, checked in priority order
+SYMPTOM_PATTERNS = tuple(
+    (re.compile("|".join(re.escape(word) for word in words)), department)
+    for words, department in [
+        (["heart", "chest", "cardiac"], "Cardiology"),
+        (["skin", "rash", "dermatitis"], "Dermatology"),
+        (["child", "baby", "pediatric"], "Pediatrics"),
+        (["bone", "joint", "fracture"], "Orthopedics"),
+        (["eye", "vision", "sight"], "Ophthalmology"),
+        (["brain", "headache", "neurological"], "Neurology"),
+        (["stomach", "digestive", "gastro"], "Gastroenterology"),
+        (["kidney", "renal", "urinary"], "Nephrology"),
+        (["cancer", "tumor", "oncology"], "Oncology"),
+        (["surgery", "operation", "surgical"], "Surgery"),
+        (["family", "general", "primary"], "Family Medicine"),
+        (["emergency", "urgent", "acute"], "Emergency Medicine"),
+        (["x-ray", "scan", "imaging"], "Radiology"),
+        (["test", "lab", "pathology"], "Pathology"),
+    ]
+)
+
+
+def match_department(text: str) -> Optional[str]:
+    """Find a department name mentioned in the text"""
+    m = DEPT_RE.search(text)
+    if m:
+        return DEPARTMENT_MAP[m.group(0).lower()]
+    return None
+
+
+def infer_department(problem: str) -> Optional[str]:
+    """Suggest a department from a problem/symptom description"""
+    problem_lower = problem.lower()
+    for pattern, department in SYMPTOM_PATTERNS:
+        if pattern.search(problem_lower):
+            return department
+    return None
+
+
+# Conversation states: idle sessions are evicted after SESSION_TTL seconds.
+# When REDIS_URL is set, states live in Redis instead so every worker shares them.
+SESSION_TTL = 3600
+CONVERSATION_STATES: "TTLCache[str, ConversationState]" = TTLCache(maxsize=10000, ttl=SESSION_TTL)
+
+
+async def load_state(session_id: str) -> ConversationState:
+    """Get the conversation state for a session, creating it if needed"""
+    client = get_redis()
+    if client is None:
+        state = CONVERSATION_STATES.get(session_id)
+        if state is None:
+            state = ConversationState()
+            CONVERSATION_STATES[session_id] = state
+        return state
+
+    # The Redis client is blocking, so keep its round-trip off the event loop
+    payload = await run_in_threadpool(client.get, f"sess:{session_id}")
+    if payload is None:
+        return ConversationState()
+    return ConversationState.from_dict(orjson.loads(payload))
+
+
+async def save_state(session_id: str, state: ConversationState) -> None:
+    """Persist the conversation state and refresh its idle timeout"""
+    client = get_redis()
+    if client is None:
+        CONVERSATION_STATES[session_id] = state
+    else:
+        await run_in_threadpool(client.setex, f"sess:{session_id}", SESSION_TTL, orjson.dumps(state.to_dict()))
+
+
+@lru_cache(maxsize=1)
+def _today_cached(minute_key: int) -> Tuple[str, str]:
+    now = datetime.now()
+    return now.strftime("%Y-%m-%d"), (now + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def today_and_tomorrow() -> Tuple[str, str]:
+    """Get today's and tomorrow's dates as YYYY-MM-DD, recomputed at most once a minute"""
+    return _today_cached(int(time.time()) // 60)
+
+
+# Replies that need no LLM call to understand
+FAST_INTENTS = {
+    "hi": {"intent": "greeting"},
+    "hello": {"intent": "greeting"},
+    "yes": {"intent": "confirm_booking"},
+    "confirm": {"intent": "confirm_booking"},
+    "no": {"intent": "other"},
+    "today": {"intent": "select_time"},
+    "tomorrow": {"intent": "select_time"},
+}
 
+INTENT_CACHE_TTL = 24 * 3600
 
-# Global conversation states
-CONVERSATION_STATES: Dict[str, ConversationState] = {}
 
+def _intent_cache_key(message: str) -> str:
+    # Relative dates ("tomorrow", "next monday") resolve differently each day,
+    # so the current date is part of the key.
+    raw = f"{llm.model_name}|{today_and_tomorrow()[0]}|{message}"
+    return "intent:" + hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
 
-def extract_intent_and_entities(message: str) -> Dict:
+
+async def extract_intent_and_entities(message: str) -> Dict:
     """Extract intent and entities from user message using OpenAI"""
-    prompt = f"""
-    Analyze this message and extract:
-    1. Intent: "greeting", "book_appointment", "provide_name", "select_department", "select_doctor", "select_time", "confirm_booking", "other"
-    2. Patient name (if mentioned)
-    3. Department (if mentioned) - look for: Cardiology, Dermatology, Emergency Medicine, Family Medicine, Gastroenterology, Nephrology, Neurology, Oncology, Ophthalmology, Orthopedics, Pathology, Pediatrics, Radiology, Surgery
-    4. Doctor name (if mentioned)
-    5. Date (if mentioned, format as YYYY-MM-DD)
-    6. Time (if mentioned, format as HH:MM)
-    7. Problem description (if mentioned)
-    
-    Important: If the user mentions a department name (like "pathology", "surgery", "neurology"), set the department field to the full department name.
-    
-    Message: "{message}"
-    
-    Return JSON format:
-    {{
-        "intent": "...",
-        "patient_name": "...",
-        "department": "...",
-        "doctor_name": "...",
-        "date": "...",
-        "time": "...",
-        "problem_description": "..."
-    }}
-    """
+    fast = FAST_INTENTS.get(message.lower().strip())
+    if fast is not None:
+        return dict(fast)
+
+    cache_key = _intent_cache_key(message)
+    cached = await get_json_async(cache_key)
+    if cached is not None:
+        return dict(cached)
+
+    prompt = _INTENT_PROMPT_PREFIX + json.dumps(message, ensure_ascii=False)
     
     try:
-        response = llm.invoke([HumanMessage(content=prompt)])
-        result = json.loads(response.content)
+        response = await llm.ainvoke([HumanMessage(content=prompt)])
+        result = orjson.loads(response.content)
         
         # Fallback: check for department names directly in the message
-        message_lower = message.lower()
-        department_mapping = {
-            "cardiology": "Cardiology",
-            "dermatology": "Dermatology", 
-            "emergency medicine": "Emergency Medicine",
-            "family medicine": "Family Medicine",
-            "gastroenterology": "Gastroenterology",
-            "nephrology": "Nephrology",
-            "neurology": "Neurology",
-            "oncology": "Oncology",
-            "ophthalmology": "Ophthalmology",
-            "orthopedics": "Orthopedics",
-            "pathology": "Pathology",
-            "pediatrics": "Pediatrics",
-            "radiology": "Radiology",
-            "surgery": "Surgery"
-        }
-        
-        for dept_key, dept_name in department_mapping.items():
-            if dept_key in message_lower and not result.get("department"):
-                result["department"] = dept_name
+        if not result.get("department"):
+            department = match_department(message)
+            if department:
+                result["department"] = department
                 result["intent"] = "select_department"
-                break
         
-        return result
+        await set_json_async(cache_key, result, INTENT_CACHE_TTL)
+        return dict(result)
     except Exception as e:
         print(f"Error parsing message: {e}")
         return {"intent": "other"}
 
 
-def process_message(session_id: str, message: str) -> Dict:
+_RESET_RE = re.compile(r"^(hi|hello|start over|reset|new appointment)$")
+_BOOKING_KEYWORDS_RE = re.compile(r"book|appointment")
+_CONFIRM_KEYWORDS_RE = re.compile(r"yes|confirm")
+
+_CONFIRM_RE = re.compile(r"^\s*(yes|no|y|n|confirm|cancel)\b", re.IGNORECASE)
+_DATE_RE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+_TIME_RE = re.compile(r"\b([01]?\d|2[0-3]):([0-5]\d)(?!\d)(?:\s*([ap])\.?m\b\.?)?")
+
+
+def _parse_confirm_fast(message: str) -> Optional[Dict]:
+    m = _CONFIRM_RE.match(message)
+    if m:
+        return {"intent": "confirm_booking", "confirmed": m.group(1).lower() in ("yes", "y", "confirm")}
+    return None
+
+
+def _parse_date_fast(message: str) -> Optional[Dict]:
+    m = _DATE_RE.search(message)
+    if m:
+        date = m.group(0)
+    elif "today" in message:
+        date = today_and_tomorrow()[0]
+    elif "tomorrow" in message:
+        date = today_and_tomorrow()[1]
+    else:
+        return None
+    return {"intent": "select_time", "date": date}
+
+
+def _parse_time_fast(message: str) -> Optional[Dict]:
+    """Parse a 24-hour or am/pm time, deferring to the LLM on anything odd
+
+    >>> _parse_time_fast("2:00 pm")
+    {'intent': 'select_time', 'time': '14:00'}
+    >>> _parse_time_fast("9:20am")
+    {'intent': 'select_time', 'time': '09:20'}
+    >>> _parse_time_fast("12:40 a.m.")
+    {'intent': 'select_time', 'time': '00:40'}
+    >>> _parse_time_fast("14:00")
+    {'intent': 'select_time', 'time': '14:00'}
+    >>> _parse_time_fast("14:00 pm") is None
+    True
+    """
+    m = _TIME_RE.search(message)
+    if not m:
+        return None
+    hour, minute, meridiem = int(m.group(1)), m.group(2), m.group(3)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == "p" else 0)
+    return {"intent": "select_time", "time": f"{hour:02d}:{minute}"}
+
+
+# Cheap per-step parsers tried before the LLM, called with the lowercased
+# message; a None result falls through to extract_intent_and_entities()
+STATE_PARSERS = {
+    "confirm_booking": _parse_confirm_fast,
+    "date_selection": _parse_date_fast,
+    "time_selection": _parse_time_fast,
+    "completed": lambda message: {"intent": "other"},
+}
+
+
+async def process_message(session_id: str, message: str) -> Dict:
     """Process a user message and return response using simple state machine"""
     
     # Get or create conversation state
-    if session_id not in CONVERSATION_STATES:
-        CONVERSATION_STATES[session_id] = ConversationState()
+    state = await load_state(session_id)
+    msg_lower = message.lower()
+    is_reset = bool(_RESET_RE.match(msg_lower))
     
-    state = CONVERSATION_STATES[session_id]
-    parsed = extract_intent_and_entities(message)
+    # Resets ignore the parsed message entirely; other steps try their
+    # fast parser and only fall back to the LLM when it can't resolve the turn
+    parsed = {}
+    if not is_reset:
+        fast_parser = STATE_PARSERS.get(state.step)
+        if fast_parser:
+            parsed = fast_parser(msg_lower)
+        if not parsed:
+            parsed = await extract_intent_and_entities(message)
     
     try:
         # Check if user wants to start over
-        if message.lower() in ["hi", "hello", "start over", "reset", "new appointment"]:
+        if is_reset:
             # Reset the conversation state
             state.patient_name = None
             state.intent = None
@@ -145,9 +346,9 @@ def process_message(session_id: str, message: str) -> Dict:
         # Step 2: Handle booking request
         elif state.step == "booking_request":
             intent = parsed.get("intent")
-            if intent == "book_appointment" or "book" in message.lower() or "appointment" in message.lower():
-                departments = list_departments()
-                dept_list = "\n".join([f"• {dept}" for dept in departments])
+            # "yes" to "Would you like to book...?" parses as confirm_booking
+            if intent in ("book_appointment", "confirm_booking") or _BOOKING_KEYWORDS_RE.search(msg_lower):
+                dept_list = await run_in_threadpool(department_list_text)
                 response = f"Great! I'd be happy to help you book an appointment. 🩺\n\nWhat type of doctor would you like to see? You can either:\n\n1. Tell me which department you need:\n{dept_list}\n\n2. Describe your problem/symptoms and I'll suggest the right department for you.\n\nWhat would you prefer?"
                 state.step = "department_selection"
             else:
@@ -160,46 +361,16 @@ def process_message(session_id: str, message: str) -> Dict:
             
             # If no department mentioned, try to infer from problem description
             if not department and problem:
-                problem_lower = problem.lower()
-                if any(word in problem_lower for word in ["heart", "chest", "cardiac"]):
-                    department = "Cardiology"
-                elif any(word in problem_lower for word in ["skin", "rash", "dermatitis"]):
-                    department = "Dermatology"
-                elif any(word in problem_lower for word in ["child", "baby", "pediatric"]):
-                    department = "Pediatrics"
-                elif any(word in problem_lower for word in ["bone", "joint", "fracture"]):
-                    department = "Orthopedics"
-                elif any(word in problem_lower for word in ["eye", "vision", "sight"]):
-                    department = "Ophthalmology"
-                elif any(word in problem_lower for word in ["brain", "headache", "neurological"]):
-                    department = "Neurology"
-                elif any(word in problem_lower for word in ["stomach", "digestive", "gastro"]):
-                    department = "Gastroenterology"
-                elif any(word in problem_lower for word in ["kidney", "renal", "urinary"]):
-                    department = "Nephrology"
-                elif any(word in problem_lower for word in ["cancer", "tumor", "oncology"]):
-                    department = "Oncology"
-                elif any(word in problem_lower for word in ["surgery", "operation", "surgical"]):
-                    department = "Surgery"
-                elif any(word in problem_lower for word in ["family", "general", "primary"]):
-                    department = "Family Medicine"
-                elif any(word in problem_lower for word in ["emergency", "urgent", "acute"]):
-                    department = "Emergency Medicine"
-                elif any(word in problem_lower for word in ["x-ray", "scan", "imaging"]):
-                    department = "Radiology"
-                elif any(word in problem_lower for word in ["test", "lab", "pathology"]):
-                    department = "Pathology"
+                department = infer_department(problem)
             
             if department:
-                doctors = find_doctors_by_department(department)
-                if doctors:
-                    doctor_list = "\n".join([f"• {doc.doctor_name}" for doc in doctors])
+                doctor_list = await run_in_threadpool(doctor_list_text, department)
+                if doctor_list:
                     response = f"Perfect! I found these doctors in the {department} department:\n\n{doctor_list}\n\nWhich doctor would you like to book an appointment with?"
                     state.selected_department = department
                     state.step = "doctor_selection"
                 else:
-                    departments = list_departments()
-                    dept_list = "\n".join([f"• {dept}" for dept in departments])
+                    dept_list = await run_in_threadpool(department_list_text)
                     response = f"I couldn't find any doctors in the {department} department. Here are the available departments:\n\n{dept_list}\n\nPlease choose from the list above."
             else:
                 response = "I need a bit more information. Could you please tell me which department you need or describe your problem so I can suggest the right doctor for you?"
@@ -212,22 +383,19 @@ def process_message(session_id: str, message: str) -> Dict:
             # Check if user wants to change department
             if department and department.lower() != state.selected_department.lower():
                 # User wants to change department
-                doctors = find_doctors_by_department(department)
-                if doctors:
-                    doctor_list = "\n".join([f"• {doc.doctor_name}" for doc in doctors])
+                doctor_list = await run_in_threadpool(doctor_list_text, department)
+                if doctor_list:
                     response = f"Perfect! I found these doctors in the {department} department:\n\n{doctor_list}\n\nWhich doctor would you like to book an appointment with?"
                     state.selected_department = department
                     state.step = "doctor_selection"
                 else:
-                    departments = list_departments()
-                    dept_list = "\n".join([f"• {dept}" for dept in departments])
+                    dept_list = await run_in_threadpool(department_list_text)
                     response = f"I couldn't find any doctors in the {department} department. Here are the available departments:\n\n{dept_list}\n\nPlease choose from the list above."
                     state.step = "department_selection"
             elif doctor_name:
-                doctor = find_doctor_by_name(doctor_name)
+                doctor = await run_in_threadpool(find_doctor_by_name, doctor_name)
                 if doctor:
-                    today = datetime.now().strftime("%Y-%m-%d")
-                    tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+                    today, tomorrow = today_and_tomorrow()
                     response = f"Excellent choice! {doctor.doctor_name} is a great {doctor.department} specialist. 🩺\n\nWhat date would you like to book your appointment? You can say:\n• Today ({today})\n• Tomorrow ({tomorrow})\n• Or any specific date (YYYY-MM-DD format)\n\nPlease note: {doctor.doctor_name} is off on {doctor.off_day}s."
                     state.selected_doctor = doctor.doctor_name
                     state.step = "date_selection"
@@ -235,28 +403,16 @@ def process_message(session_id: str, message: str) -> Dict:
                     response = f"I couldn't find a doctor named {doctor_name}. Could you please check the spelling and try again?"
             else:
                 # Check if user mentioned a department name directly
-                message_lower = message.lower()
-                if any(dept.lower() in message_lower for dept in ["cardiology", "dermatology", "emergency medicine", "family medicine", 
-                                                                "gastroenterology", "nephrology", "neurology", "oncology", 
-                                                                "ophthalmology", "orthopedics", "pathology", "pediatrics", 
-                                                                "radiology", "surgery"]):
-                    # Extract department from message
-                    for dept in ["Cardiology", "Dermatology", "Emergency Medicine", "Family Medicine", 
-                                "Gastroenterology", "Nephrology", "Neurology", "Oncology", 
-                                "Ophthalmology", "Orthopedics", "Pathology", "Pediatrics", 
-                                "Radiology", "Surgery"]:
-                        if dept.lower() in message_lower:
-                            doctors = find_doctors_by_department(dept)
-                            if doctors:
-                                doctor_list = "\n".join([f"• {doc.doctor_name}" for doc in doctors])
-                                response = f"Perfect! I found these doctors in the {dept} department:\n\n{doctor_list}\n\nWhich doctor would you like to book an appointment with?"
-                                state.selected_department = dept
-                                state.step = "doctor_selection"
-                                break
-                            else:
-                                response = f"I couldn't find any doctors in the {dept} department. Please choose a different department."
-                                state.step = "department_selection"
-                                break
+                dept = match_department(message)
+                if dept:
+                    doctor_list = await run_in_threadpool(doctor_list_text, dept)
+                    if doctor_list:
+                        response = f"Perfect! I found these doctors in the {dept} department:\n\n{doctor_list}\n\nWhich doctor would you like to book an appointment with?"
+                        state.selected_department = dept
+                        state.step = "doctor_selection"
+                    else:
+                        response = f"I couldn't find any doctors in the {dept} department. Please choose a different department."
+                        state.step = "department_selection"
                 else:
                     response = "I didn't catch the doctor's name. Could you please tell me which doctor you'd like to book an appointment with, or if you want to change departments, just tell me the department name."
         
@@ -266,19 +422,20 @@ def process_message(session_id: str, message: str) -> Dict:
             
             # Handle common date expressions
             if not date:
-                if "today" in message.lower():
-                    date = datetime.now().strftime("%Y-%m-%d")
-                elif "tomorrow" in message.lower():
-                    date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+                today, tomorrow = today_and_tomorrow()
+                if "today" in msg_lower:
+                    date = today
+                elif "tomorrow" in msg_lower:
+                    date = tomorrow
             
             if date:
-                # Check if doctor is available on this date
-                if not check_doctor_availability(state.selected_doctor, date):
-                    doctor = find_doctor_by_name(state.selected_doctor)
-                    response = f"Sorry, {state.selected_doctor} is not available on {date} (it's their {doctor.off_day} off day). Please choose a different date."
+                # Check the doctor's off day and free slots in one lookup
+                availability = await run_in_threadpool(get_availability, state.selected_doctor, date)
+                
+                if availability and availability["is_off_day"]:
+                    response = f"Sorry, {state.selected_doctor} is not available on {date} (it's their {availability['off_day']} off day). Please choose a different date."
                 else:
-                    # Get available time slots
-                    available_slots = get_doctor_available_slots(state.selected_doctor, date)
+                    available_slots = availability["slots"] if availability else []
                     
                     if available_slots:
                         slots_text = "\n".join([f"• {slot}" for slot in available_slots[:10]])  # Show first 10 slots
@@ -287,6 +444,13 @@ def process_message(session_id: str, message: str) -> Dict:
                         state.step = "time_selection"
                     else:
                         response = f"Sorry, {state.selected_doctor} has no available slots on {date}. Please choose a different date."
+                
+                if state.step == "date_selection":
+                    # Point the patient at the next dates that do have openings
+                    week = await run_in_threadpool(get_doctor_weekly_availability, state.selected_doctor, date)
+                    open_dates = [day for day, slots in week.items() if slots and day != date][:3]
+                    if open_dates:
+                        response += f"\n\nThe next dates with open slots are: {', '.join(open_dates)}."
             else:
                 response = "I need a specific date for your appointment. Please tell me which date you'd like (today, tomorrow, or a specific date in YYYY-MM-DD format)."
         
@@ -296,7 +460,7 @@ def process_message(session_id: str, message: str) -> Dict:
             
             if time:
                 # Check if the time slot is still available
-                available_slots = get_doctor_available_slots(state.selected_doctor, state.selected_date)
+                available_slots = await run_in_threadpool(get_doctor_available_slots, state.selected_doctor, state.selected_date)
                 
                 if time in available_slots:
                     # Confirm booking details
@@ -305,7 +469,7 @@ def process_message(session_id: str, message: str) -> Dict:
                     state.step = "confirm_booking"
                 else:
                     # Suggest alternative slots
-                    alternatives = suggest_alternative_slots(state.selected_doctor, state.selected_date, time)
+                    alternatives = await run_in_threadpool(suggest_alternative_slots, state.selected_doctor, state.selected_date, time)
                     if alternatives:
                         alt_text = "\n".join([f"• {alt}" for alt in alternatives])
                         response = f"Sorry, {time} is no longer available. Here are some alternative time slots:\n\n{alt_text}\n\nWhich one would you prefer?"
@@ -317,9 +481,15 @@ def process_message(session_id: str, message: str) -> Dict:
         
         # Step 7: Confirm booking
         elif state.step == "confirm_booking":
-            if "yes" in message.lower() or "confirm" in message.lower():
+            # The fast parser decides yes/no itself; LLM-parsed replies fall
+            # back to looking for a confirmation keyword
+            confirmed = parsed.get("confirmed")
+            if confirmed is None:
+                confirmed = bool(_CONFIRM_KEYWORDS_RE.search(msg_lower))
+            if confirmed:
                 # Create the booking
-                booking = create_booking(
+                booking = await run_in_threadpool(
+                    create_booking,
                     state.patient_name,
                     state.selected_doctor,
                     state.selected_date,
@@ -350,6 +520,7 @@ def process_message(session_id: str, message: str) -> Dict:
         else:
             response = "I'm sorry, I didn't understand that. Could you please try again?"
         
+        await save_state(session_id, state)
         return {
             "reply": response,
             "done": state.booking_confirmed,
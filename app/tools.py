@@ -1,111 +1,266 @@
-from datetime import datetime, timedelta
-from typing import List, Optional
-from .database import SessionLocal
+import heapq
+from dataclasses import dataclass
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from . import cache
+from .cache import cached
+from .database import SessionLocal, has_slot_index
 from .models import Doctor, Booking
 
 
+# Doctor data only changes through the admin endpoints, which drop it with
+# invalidate_doctor_cache(); the TTLs bound how stale it can get when another
+# worker made the change and Redis isn't shared. Availability is cached
+# briefly and dropped whenever a booking is created or cancelled.
+CATALOG_CACHE_TTL = 600
+DOCTORS_CACHE_TTL = 300
+AVAILABILITY_CACHE_TTL = 30
+
+
+# Tools return plain records rather than ORM instances, so callers never touch
+# a detached instance and results can be cached or pickled as-is
+@dataclass(slots=True)
+class DoctorDTO:
+    id: int
+    doctor_name: str
+    department: str
+    available_start: str
+    available_end: str
+    off_day: Optional[str]
+
+
+@dataclass(slots=True)
+class BookingDTO:
+    id: int
+    patient_name: str
+    doctor_name: str
+    date: str
+    time_slot: str
+
+
+# Columns in DTO field order, for select()/returning()
+DOCTOR_COLUMNS = (
+    Doctor.id, Doctor.doctor_name, Doctor.department,
+    Doctor.available_start, Doctor.available_end, Doctor.off_day
+)
+BOOKING_COLUMNS = (Booking.id, Booking.patient_name, Booking.doctor_name, Booking.date, Booking.time_slot)
+
+
+@cached("departments", CATALOG_CACHE_TTL)
 def list_departments() -> List[str]:
     """Get all available departments"""
-    db = SessionLocal()
-    deps = db.query(Doctor.department).distinct().all()
-    db.close()
-    return [d[0] for d in deps]
+    with SessionLocal() as db:
+        return list(db.execute(select(Doctor.department).distinct()).scalars().all())
 
 
-def find_doctors_by_department(dept: str) -> List[Doctor]:
-    """Find doctors by department"""
-    db = SessionLocal()
-    docs = db.query(Doctor).filter(Doctor.department.ilike(f"%{dept}%")).all()
-    db.close()
-    return docs
+@cached("departments:text", CATALOG_CACHE_TTL)
+def department_list_text() -> str:
+    """Get the departments rendered as a bulleted list for chat replies"""
+    return "\n".join([f"• {dept}" for dept in list_departments()])
 
 
-def find_doctor_by_name(name: str) -> Optional[Doctor]:
-    """Find doctor by name"""
-    db = SessionLocal()
-    doc = db.query(Doctor).filter(Doctor.doctor_name.ilike(f"%{name}%")).first()
-    db.close()
-    return doc
+def find_doctors_by_department(dept: str) -> List[DoctorDTO]:
+    """Find doctors by department, preferring an exact (case-insensitive) match"""
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(*DOCTOR_COLUMNS).where(func.lower(Doctor.department) == dept.lower())
+        ).all()
+        if not rows:
+            rows = db.execute(
+                select(*DOCTOR_COLUMNS).where(Doctor.department.ilike(f"%{dept}%"))
+            ).all()
+    return [DoctorDTO(*row) for row in rows]
 
 
-def generate_time_slots(start_time: str, end_time: str) -> List[str]:
-    """Generate 20-minute time slots between start and end time"""
-    slots = []
-    start = datetime.strptime(start_time, "%H:%M")
-    end = datetime.strptime(end_time, "%H:%M")
-    
-    current = start
-    while current < end:
-        slots.append(current.strftime("%H:%M"))
-        current += timedelta(minutes=20)
-    
-    return slots
+@cached("doctors:text:{0}", CATALOG_CACHE_TTL)
+def doctor_list_text(dept: str) -> str:
+    """Get a department's doctors rendered as a bulleted list, or "" if there are none"""
+    return "\n".join([f"• {doc.doctor_name}" for doc in find_doctors_by_department(dept)])
 
 
-def get_doctor_available_slots(doctor_name: str, date: str) -> List[str]:
-    """Get available time slots for a doctor on a specific date"""
-    db = SessionLocal()
-    
-    # Get doctor info
-    doc = db.query(Doctor).filter(Doctor.doctor_name == doctor_name).first()
-    if not doc:
-        db.close()
-        return []
-    
-    # Generate all possible slots
-    all_slots = generate_time_slots(doc.available_start, doc.available_end)
-    
-    # Get already booked slots
-    booked = db.query(Booking).filter(
-        Booking.doctor_name == doctor_name, 
-        Booking.date == date
+def invalidate_doctor_cache() -> None:
+    """Drop cached doctor/department data after the doctors table changes"""
+    cache.delete("departments", "departments:text", "doctors")
+    cache.delete_prefix("doctors:text:")
+    cache.delete_prefix("available|")
+
+
+def invalidate_availability_cache(doctor_name: str, date: str) -> None:
+    """Drop the cached free slots for a doctor/date after a booking changes"""
+    cache.delete(f"available|{doctor_name}|{date}")
+
+
+def find_doctor_by_name(name: str) -> Optional[DoctorDTO]:
+    """Find doctor by name, preferring an exact (case-insensitive) match"""
+    with SessionLocal() as db:
+        row = db.execute(
+            select(*DOCTOR_COLUMNS).where(func.lower(Doctor.doctor_name) == name.lower()).limit(1)
+        ).first()
+        if row is None:
+            row = db.execute(
+                select(*DOCTOR_COLUMNS).where(Doctor.doctor_name.ilike(f"%{name}%")).limit(1)
+            ).first()
+    return DoctorDTO(*row) if row else None
+
+
+SLOT_MINUTES = 20
+
+# Indexed by date.weekday(); Doctor.off_day is stored in this spelling
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def _to_minutes(hhmm: str) -> int:
+    """Convert HH:MM to minutes since midnight"""
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _from_minutes(minutes: int) -> str:
+    """Convert minutes since midnight to HH:MM"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _slot_minutes(start_min: int, end_min: int, step: int = SLOT_MINUTES) -> range:
+    """Slot start times in minutes since midnight, from start up to (not including) end"""
+    return range(start_min, end_min, step)
+
+
+@lru_cache(maxsize=512)
+def generate_time_slots(start_time: str, end_time: str) -> Tuple[str, ...]:
+    """Generate 20-minute time slots between start and end time (memoized per working hours)"""
+    return tuple(_from_minutes(m) for m in _slot_minutes(_to_minutes(start_time), _to_minutes(end_time)))
+
+
+def _booked_slots_agg(db):
+    """Comma-joined Booking.time_slot aggregate for the session's database"""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.string_agg(Booking.time_slot, ",")
+    return func.group_concat(Booking.time_slot)
+
+
+def _load_availability_range(db, doctor_name: str, start_date: str, end_date: str) -> Optional[Dict[str, Dict]]:
+    """Read a doctor's schedule and booked slots for every date from start_date to end_date in one query"""
+    rows = db.execute(
+        select(Doctor.available_start, Doctor.available_end, Doctor.off_day, Booking.date, _booked_slots_agg(db))
+        .outerjoin(Booking, and_(
+            Booking.doctor_name == Doctor.doctor_name,
+            Booking.date.between(start_date, end_date)
+        ))
+        .where(Doctor.doctor_name == doctor_name)
+        .group_by(Doctor.id, Booking.date)
     ).all()
-    booked_slots = [b.time_slot for b in booked]
     
-    db.close()
+    if not rows:
+        return None
+    
+    available_start, available_end, off_day = rows[0][:3]
+    # Rows are grouped by date, so each booked date appears once
+    booked = {day: set(slots.split(",")) for *_, day, slots in rows if day is not None}
+    all_slots = generate_time_slots(available_start, available_end)
     
-    # Return available slots
-    available = [s for s in all_slots if s not in booked_slots]
-    return available
+    availability = {}
+    current = date.fromisoformat(start_date)
+    last = date.fromisoformat(end_date)
+    while current <= last:
+        day = current.isoformat()
+        taken = booked.get(day)
+        availability[day] = {
+            "off_day": off_day,
+            "is_off_day": bool(off_day) and WEEKDAYS[current.weekday()] == off_day,
+            "slots": [s for s in all_slots if s not in taken] if taken else list(all_slots)
+        }
+        current += timedelta(days=1)
+    return availability
 
 
-def create_booking(patient_name: str, doctor_name: str, date: str, time_slot: str) -> Optional[Booking]:
-    """Create a new booking"""
-    db = SessionLocal()
-    
-    # Check if slot is already booked
-    exists = db.query(Booking).filter(
-        Booking.doctor_name == doctor_name, 
-        Booking.date == date, 
-        Booking.time_slot == time_slot
-    ).first()
+def _load_availability(db, doctor_name: str, date: str) -> Optional[Dict]:
+    """Read a doctor's schedule and booked slots for a date in one query"""
+    availability = _load_availability_range(db, doctor_name, date, date)
+    return availability[date] if availability else None
+
+
+@cached("available|{0}|{1}", AVAILABILITY_CACHE_TTL)
+def get_availability(doctor_name: str, date: str) -> Optional[Dict]:
+    """Get a doctor's off-day status and free slots for a date, or None if the doctor doesn't exist"""
+    with SessionLocal() as db:
+        return _load_availability(db, doctor_name, date)
+
+
+def get_doctor_weekly_availability(doctor_name: str, start_date: str, days: int = 7) -> Dict[str, List[str]]:
+    """Get free slots for each day starting at start_date; off days have none"""
+    end_date = (date.fromisoformat(start_date) + timedelta(days=days - 1)).isoformat()
+    with SessionLocal() as db:
+        availability = _load_availability_range(db, doctor_name, start_date, end_date)
     
-    if exists:
-        db.close()
+    if not availability:
+        return {}
+    return {day: [] if info["is_off_day"] else info["slots"] for day, info in availability.items()}
+
+
+def get_doctor_available_slots(doctor_name: str, date: str) -> List[str]:
+    """Get available time slots for a doctor on a specific date"""
+    availability = get_availability(doctor_name, date)
+    return availability["slots"] if availability else []
+
+
+# Dialects whose insert() supports ON CONFLICT DO NOTHING
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def create_booking(patient_name: str, doctor_name: str, date: str, time_slot: str) -> Optional[BookingDTO]:
+    """Create a new booking, or return None if the slot is already taken
+
+    On SQLite and PostgreSQL the insert relies on the unique (doctor_name,
+    date, time_slot) index with ON CONFLICT DO NOTHING ... RETURNING, so the
+    booking is claimed and loaded in a single statement and concurrent
+    requests can't double-book a slot. Other databases, and databases where
+    init_db() couldn't build the index because of existing duplicates, lock
+    any existing booking for the slot with SELECT ... FOR UPDATE before
+    inserting; where the index exists it turns a lost race into an
+    IntegrityError.
+    """
+    values = dict(patient_name=patient_name, doctor_name=doctor_name, date=date, time_slot=time_slot)
+    try:
+        with SessionLocal.begin() as db:
+            dialect = db.get_bind().dialect.name
+            if dialect in _UPSERT_INSERTS and has_slot_index():
+                stmt = _UPSERT_INSERTS[dialect](Booking).values(**values).on_conflict_do_nothing(
+                    index_elements=["doctor_name", "date", "time_slot"]
+                ).returning(*BOOKING_COLUMNS)
+                # No row comes back when the slot was already taken
+                row = db.execute(stmt).first()
+                booking = BookingDTO(*row) if row else None
+            else:
+                taken = db.scalar(
+                    select(Booking.id).where(
+                        Booking.doctor_name == doctor_name,
+                        Booking.date == date,
+                        Booking.time_slot == time_slot
+                    ).with_for_update()
+                )
+                booking = None
+                if taken is None:
+                    new_booking = Booking(**values)
+                    db.add(new_booking)
+                    db.flush()
+                    booking = BookingDTO(new_booking.id, **values)
+    except IntegrityError:
         return None
     
-    # Create booking
-    booking = Booking(
-        patient_name=patient_name,
-        doctor_name=doctor_name,
-        date=date,
-        time_slot=time_slot
-    )
-    
-    db.add(booking)
-    db.commit()
-    db.refresh(booking)
-    db.close()
-    
+    if booking:
+        invalidate_availability_cache(doctor_name, date)
     return booking
 
 
-def get_booking_details(booking_id: int) -> Optional[Booking]:
+def get_booking_details(booking_id: int) -> Optional[BookingDTO]:
     """Get booking details by ID"""
-    db = SessionLocal()
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
-    db.close()
-    return booking
+    with SessionLocal() as db:
+        row = db.execute(select(*BOOKING_COLUMNS).where(Booking.id == booking_id)).first()
+    return BookingDTO(*row) if row else None
 
 
 def suggest_alternative_slots(doctor_name: str, date: str, preferred_time: str) -> List[str]:
@@ -119,47 +274,33 @@ def suggest_alternative_slots(doctor_name: str, date: str, preferred_time: str)
     if preferred_time in available_slots:
         return [preferred_time]
     
-    # Find closest available slots
-    preferred_dt = datetime.strptime(preferred_time, "%H:%M")
-    available_dts = [datetime.strptime(slot, "%H:%M") for slot in available_slots]
-    
-    # Sort by time difference from preferred time
-    available_dts.sort(key=lambda x: abs((x - preferred_dt).total_seconds()))
-    
-    # Return up to 3 closest alternatives
-    return [dt.strftime("%H:%M") for dt in available_dts[:3]]
+    # Return up to 3 available slots closest to the preferred time
+    preferred = _to_minutes(preferred_time)
+    return heapq.nsmallest(3, available_slots, key=lambda slot: abs(_to_minutes(slot) - preferred))
 
 
 def check_doctor_availability(doctor_name: str, date: str) -> bool:
     """Check if doctor is available on a specific date"""
-    db = SessionLocal()
-    doc = db.query(Doctor).filter(Doctor.doctor_name == doctor_name).first()
-    db.close()
-    
-    if not doc:
-        return False
-    
-    # Check if it's the doctor's off day
-    date_obj = datetime.strptime(date, "%Y-%m-%d")
-    day_name = date_obj.strftime("%A")
-    
-    if doc.off_day and day_name == doc.off_day:
-        return False
-    
-    return True
+    availability = get_availability(doctor_name, date)
+    return bool(availability) and not availability["is_off_day"]
+
+
+@cached("doctors", DOCTORS_CACHE_TTL)
+def _doctor_rows() -> List[Dict]:
+    with SessionLocal() as db:
+        rows = db.execute(select(*DOCTOR_COLUMNS)).all()
+    return [dict(row._mapping) for row in rows]
 
 
-def get_all_doctors() -> List[Doctor]:
+def get_all_doctors() -> List[DoctorDTO]:
     """Get all doctors"""
-    db = SessionLocal()
-    doctors = db.query(Doctor).all()
-    db.close()
-    return doctors
+    return [DoctorDTO(**row) for row in _doctor_rows()]
 
 
-def get_patient_bookings(patient_name: str) -> List[Booking]:
+def get_patient_bookings(patient_name: str) -> List[BookingDTO]:
     """Get all bookings for a patient"""
-    db = SessionLocal()
-    bookings = db.query(Booking).filter(Booking.patient_name == patient_name).all()
-    db.close()
-    return bookings
\ No newline at end of file
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(*BOOKING_COLUMNS).where(Booking.patient_name == patient_name)
+        ).all()
+    return [BookingDTO(*row) for row in rows]
\ No newline at end of file
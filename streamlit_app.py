@@ -1,5 +1,8 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import itertools
 import json
 import uuid
 from datetime import datetime
@@ -16,6 +19,9 @@ st.set_page_config(
 # API base URL
 API_BASE_URL = "http://localhost:8000"
 
+# (connect, read) timeouts so a hung backend can't freeze the UI
+REQUEST_TIMEOUT = (3, 30)
+
 # Initialize session state
 if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
@@ -27,32 +33,65 @@ if "booking_details" not in st.session_state:
     st.session_state.booking_details = None
 
 
-def send_message(message: str) -> dict:
-    """Send message to the API"""
+@st.cache_resource
+def _client() -> requests.Session:
+    """Shared HTTP session so API calls reuse keep-alive connections"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=8,
+        max_retries=Retry(total=2, backoff_factor=0.1)
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_catalog(path: str):
+    """GET a rarely-changing API resource; failures raise so they aren't cached"""
+    response = _client().get(f"{API_BASE_URL}{path}", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _probe_api() -> bool:
+    """Check the API is up; failures raise so they aren't cached"""
+    response = _client().get(f"{API_BASE_URL}/", timeout=1)
+    response.raise_for_status()
+    return True
+
+
+def send_message(message: str):
+    """Send message to the API, yielding reply chunks; booking details arrive on the trailing line"""
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/chat",
+        with _client().post(
+            f"{API_BASE_URL}/chat/stream",
             json={
                 "message": message,
                 "session_id": st.session_state.session_id
-            }
-        )
-        response.raise_for_status()
-        return response.json()
+            },
+            timeout=REQUEST_TIMEOUT,
+            stream=True
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "delta" in chunk:
+                    yield chunk["delta"]
+                elif chunk.get("booking_details"):
+                    st.session_state.booking_details = chunk["booking_details"]
     except requests.exceptions.RequestException as e:
-        return {
-            "reply": f"Sorry, I'm having trouble connecting to the server. Error: {str(e)}",
-            "done": False,
-            "booking_details": None
-        }
+        yield f"Sorry, I'm having trouble connecting to the server. Error: {str(e)}"
 
 
 def get_doctors():
     """Get all doctors from API"""
     try:
-        response = requests.get(f"{API_BASE_URL}/doctors")
-        response.raise_for_status()
-        return response.json()
+        return _fetch_catalog("/doctors")
     except requests.exceptions.RequestException:
         return []
 
@@ -60,9 +99,7 @@ def get_doctors():
 def get_departments():
     """Get all departments from API"""
     try:
-        response = requests.get(f"{API_BASE_URL}/doctors/departments")
-        response.raise_for_status()
-        return response.json()
+        return _fetch_catalog("/doctors/departments")
     except requests.exceptions.RequestException:
         return []
 
@@ -85,6 +122,10 @@ def main():
         else:
             st.write("Loading departments...")
         
+        if st.button("🔃 Refresh Catalog"):
+            _fetch_catalog.clear()
+            st.rerun()
+        
         st.markdown("---")
         
         # Reset conversation button
@@ -117,20 +158,18 @@ def main():
         with st.chat_message("user"):
             st.write(prompt)
         
-        # Get AI response
+        # Get AI response, rendering it as it streams in; booking details
+        # are stored from the stream's trailing line. The reply only starts
+        # once the agent has handled the turn, so keep the spinner up until
+        # the first chunk arrives.
         with st.chat_message("assistant"):
+            chunks = send_message(prompt)
             with st.spinner("Thinking..."):
-                response = send_message(prompt)
-            
-            # Display AI response
-            st.write(response["reply"])
+                first_chunk = next(chunks, "")
+            reply = st.write_stream(itertools.chain([first_chunk], chunks))
             
             # Add AI response to chat history
-            st.session_state.messages.append({"role": "assistant", "content": response["reply"]})
-            
-            # Store booking details if available
-            if response.get("booking_details"):
-                st.session_state.booking_details = response["booking_details"]
+            st.session_state.messages.append({"role": "assistant", "content": reply})
     
     # Booking status
     if st.session_state.booking_details:
@@ -163,17 +202,19 @@ def main():
     )
 
 
-
-
 if __name__ == "__main__":
-    # Check if API is running
+    # Check if API is running; the probe is cached so reruns don't hit the API
+    api_error = None
     try:
-        response = requests.get(f"{API_BASE_URL}/")
-        if response.status_code == 200:
-            main()
-        else:
-            st.error("❌ API server is not responding. Please make sure the FastAPI server is running on http://localhost:8000")
-    except requests.exceptions.RequestException:
+        _probe_api()
+    except requests.exceptions.RequestException as e:
+        api_error = e
+    
+    if api_error is None:
+        main()
+    elif isinstance(api_error, requests.exceptions.HTTPError):
+        st.error("❌ API server is not responding. Please make sure the FastAPI server is running on http://localhost:8000")
+    else:
         st.error("❌ Cannot connect to API server. Please make sure the FastAPI server is running on http://localhost:8000")
         
         st.markdown("### 🚀 To start the API server:")